@@ -8,7 +8,7 @@ Usage:
   1. Interactive:     python3 scraper.py
   2. Single query:    python3 scraper.py "coffee shops in nyc"
   3. From CSV:        python3 scraper.py --csv queries.csv
-  4. From config:     python3 scraper.py --config config.yaml
+  4. From config:     python3 scraper.py --config config.yaml (or .toml / .json)
 """
 
 from __future__ import annotations
@@ -16,57 +16,173 @@ from __future__ import annotations
 import argparse
 import asyncio
 import csv
+import functools
+import itertools
 import json
-import re
+import mmap
+import os
 import sys
+from contextlib import nullcontext
 from pathlib import Path
-from typing import Any
+from typing import Any, Iterable, Iterator
 
 from playwright.async_api import async_playwright
 
+# Optional: orjson serializes several times faster than json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Optional: uvloop is a faster drop-in event loop (not available on Windows)
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
 from maps_scraper import (
     ProxyPool,
+    browser_manager,
+    context_pool,
     load_proxies,
     scrape_query,
     test_proxy,
 )
 
 
+# Max proxy probes in flight for --test-proxies
+PROXY_TEST_CONCURRENCY = 20
+
+def parse_bool(value: Any) -> bool:
+    """Parse a config boolean: true/false, yes/no or 1/0 (strings or native values)."""
+    if isinstance(value, bool):
+        return value
+    val = str(value).strip().lower()
+    if val in {"true", "yes", "1"}:
+        return True
+    if val in {"false", "no", "0"}:
+        return False
+    raise ValueError(f"expected true/false, yes/no or 1/0, got {value!r}")
+
+
+# Config file keys that override the CLI option of the same name, with their type
+_CONFIG_KEYS: dict[str, Any] = {
+    "proxies": Path,
+    "output_dir": Path,
+    "output_file": Path,
+    "output_ndjson": Path,
+    "concurrency": str,
+    "query_concurrency": int,
+    "timeout": float,
+    "scroll_limit": int,
+    "scroll_pause": float,
+    "pretty": parse_bool,
+}
+
+# Mutually exclusive output destinations (one per run, from the CLI or the config)
+_OUTPUT_KEYS = ("output_dir", "output_file", "output_ndjson")
+
+
+class _FilenameTable(dict):
+    r"""str.translate table: drop chars outside [\w\s-], turn whitespace into '-'.
+
+    Entries are computed on first sight of a code point and cached.
+    """
+
+    def __missing__(self, codepoint: int) -> str | None:
+        ch = chr(codepoint)
+        if ch.isspace():
+            value = '-'
+        elif ch.isalnum() or ch in '_-':
+            value = ch
+        else:
+            value = None
+        self[codepoint] = value
+        return value
+
+
+_FILENAME_TABLE = _FilenameTable()
+
+
+@functools.lru_cache(maxsize=4096)
 def sanitize_filename(text: str, max_len: int = 50) -> str:
     """Convert query to safe filename."""
-    safe = re.sub(r'[^\w\s-]', '', text.lower())
-    safe = re.sub(r'[-\s]+', '-', safe).strip('-')
+    # Collapse runs of '-' (and former whitespace), trimming both ends
+    safe = '-'.join(filter(None, text.lower().translate(_FILENAME_TABLE).split('-')))
     return safe[:max_len]
 
 
-def load_queries_from_csv(path: Path) -> list[dict[str, str]]:
-    """Load queries from CSV file."""
-    queries = []
-    with open(path, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            if 'query' in row:
-                queries.append(row)
-    return queries
+def iter_queries_from_csv(path: Path) -> Iterator[str]:
+    """Yield queries from the 'query' column of a CSV file, row by row.
+    
+    Leading '#' comment lines before the header are skipped. The file is
+    memory-mapped and read sequentially, so large files are paged in by the
+    OS instead of being copied through Python's buffered text layer.
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if hasattr(mm, "madvise") and hasattr(mmap, "MADV_SEQUENTIAL"):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            lines = (line.decode('utf-8') for line in iter(mm.readline, b''))
+            yield from _iter_query_column(csv.reader(lines))
+
+
+def _iter_query_column(reader: Iterator[list[str]]) -> Iterator[str]:
+    """Yield the 'query' column from CSV rows, locating it from the header."""
+    for header in reader:
+        if header and not header[0].lstrip().startswith('#'):
+            break
+    else:
+        return
+    
+    if 'query' not in header:
+        return
+    idx = header.index('query')
+    
+    for row in reader:
+        if idx < len(row) and row[idx]:
+            yield row[idx]
 
 
 def load_config(path: Path) -> dict[str, Any]:
-    """Load configuration from YAML or JSON file."""
-    text = path.read_text(encoding='utf-8')
+    """Load configuration from YAML, TOML or JSON file."""
+    # Parsers take bytes directly; only TOML needs a decoded str
+    data = path.read_bytes()
     
     if path.suffix in ('.yaml', '.yml'):
         try:
             import yaml
-            return yaml.safe_load(text)
         except ImportError:
             print("PyYAML required for YAML config. Install: pip install pyyaml", file=sys.stderr)
             sys.exit(1)
+        # The libyaml-backed loader is much faster when PyYAML was built with it
+        loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+        return yaml.load(data, Loader=loader)
+    elif path.suffix == '.toml':
+        try:
+            import tomllib
+        except ImportError:  # Python < 3.11
+            try:
+                import tomli as tomllib
+            except ImportError:
+                print("tomli required for TOML config on Python < 3.11. Install: pip install tomli", file=sys.stderr)
+                sys.exit(1)
+        return tomllib.loads(data.decode('utf-8'))
     else:
-        return json.loads(text)
+        return orjson.loads(data) if orjson is not None else json.loads(data)
 
 
 def interactive_mode() -> list[str]:
-    """Interactive prompt for queries."""
+    """Interactive prompt for queries (reads all lines when stdin is piped)."""
+    if not sys.stdin.isatty():
+        queries = [q for q in (line.strip() for line in sys.stdin) if q]
+        if not queries:
+            print("No queries on stdin. Exiting.")
+            sys.exit(0)
+        return queries
+    
     print("=" * 60)
     print("Google Maps Scraper - Interactive Mode")
     print("=" * 60)
@@ -91,14 +207,23 @@ def interactive_mode() -> list[str]:
     return queries
 
 
-def get_output_path(query: str, output_dir: Path, index: int | None = None) -> Path:
-    """Generate output file path for a query."""
-    safe_name = sanitize_filename(query)
-    if index is not None:
-        filename = f"{index:03d}_{safe_name}.json"
-    else:
-        filename = f"{safe_name}.json"
-    return output_dir / filename
+def get_output_path(query: str, output_dir: Path, prefix: str | None = None) -> Path:
+    """Generate output file path for a query.
+    
+    prefix is an already formatted filename prefix such as "001_".
+    """
+    if prefix:
+        return output_dir / f"{prefix}{sanitize_filename(query)}.json"
+    return output_dir / f"{sanitize_filename(query)}.json"
+
+
+def dump_json(data: Any, pretty: bool = False) -> bytes:
+    """Serialize output data to UTF-8 JSON (compact unless pretty)."""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 if pretty else None)
+    if pretty:
+        return json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
 
 
 def parse_concurrency(raw: str) -> int | None:
@@ -113,7 +238,7 @@ def parse_concurrency(raw: str) -> int | None:
 
 
 async def run_simple(
-    queries: list[str],
+    queries: Iterable[str],
     proxies_file: Path | None = None,
     output_dir: Path = Path("output"),
     concurrency: str = "5",
@@ -121,11 +246,30 @@ async def run_simple(
     headless: bool = True,
     scroll_limit: int = 10,
     scroll_pause: float = 2.0,
+    total: int | None = None,
+    query_concurrency: int = 3,
+    pretty: bool = False,
+    output_ndjson: Path | None = None,
+    playwright=None,
+    output_file: Path | None = None,
 ) -> None:
-    """Run scraper with simplified interface."""
+    """Run scraper with simplified interface.
+    
+    queries may be a lazy iterator; total (if known) is only used for progress output.
+    With output_ndjson, all results go to that one file (one JSON object per
+    line) instead of one file per query in output_dir. With output_file, results
+    are written to exactly that path (index-prefixed if there are several
+    queries). A running playwright instance may be passed in to share it with
+    other phases of the run.
+    """
+    
+    if output_ndjson and output_file:
+        raise ValueError("output_ndjson and output_file are mutually exclusive")
     
-    # Create output directory
-    output_dir.mkdir(parents=True, exist_ok=True)
+    # Create output directory (or the parent of the single output file)
+    single_file = output_ndjson or output_file
+    abs_out = (single_file or output_dir).absolute()
+    (single_file.parent if single_file else output_dir).mkdir(parents=True, exist_ok=True)
     
     # Load proxies
     proxies = load_proxies(proxies_file)
@@ -136,50 +280,142 @@ async def run_simple(
     else:
         print("⚠ No proxies loaded - using direct connection")
     
+    # --concurrency caps open browser contexts; each in-flight query leases one
     concurrency_val = parse_concurrency(concurrency)
-    print(f"✓ Concurrency: {'unlimited' if concurrency_val is None else concurrency_val}")
+    context_pool.resize(concurrency_val or query_concurrency)
+    effective_queries = min(query_concurrency, context_pool.max_contexts)
+    print(f"✓ Concurrency: {context_pool.max_contexts} browser context(s)"
+          + (" (unlimited: one per query)" if concurrency_val is None else ""))
+    print(f"✓ Query concurrency: {effective_queries}"
+          + (f" (limited by --concurrency {concurrency_val})" if effective_queries < query_concurrency else ""))
     print(f"✓ Scroll limit: {scroll_limit}")
-    print(f"✓ Output directory: {output_dir.absolute()}")
+    # Several queries with --output-file get index-prefixed names next to the given path
+    prefixed_out = abs_out.parent / f"NNN_{abs_out.name}"
+    if output_file and total is not None and total > 1:
+        print(f"✓ Output files: {prefixed_out}")
+    elif output_file and total is None:
+        print(f"✓ Output file: {abs_out} (as {prefixed_out} if there are several queries)")
+    else:
+        print(f"✓ Output {'file' if single_file else 'directory'}: {abs_out}")
     print(f"✓ Browser mode: {'headless' if headless else 'visible'}")
     print()
     
-    async with async_playwright() as playwright:
-        for i, query in enumerate(queries, 1):
-            output_path = get_output_path(query, output_dir, i if len(queries) > 1 else None)
-            
-            print(f"[{i}/{len(queries)}] Searching: \"{query}\"")
-            
+    # Formatted once; streamed input has no known total
+    total_suffix = f"/{total}" if total is not None else ""
+    
+    ndjson = None
+    multi = False
+    
+    async with nullcontext(playwright) if playwright else async_playwright() as playwright:
+        sem = asyncio.Semaphore(effective_queries)
+        
+        async def _one(i: int, query: str, prefix: str | None) -> None:
             try:
-                results = await scrape_query(
-                    playwright=playwright,
-                    query=query,
-                    proxy_pool=proxy_pool,
-                    timeout_s=timeout,
-                    concurrency=concurrency_val,
-                    headless=headless,
-                    scroll_limit=scroll_limit,
-                    scroll_pause=scroll_pause,
-                )
+                if ndjson:
+                    output_path = output_ndjson
+                elif output_file:
+                    # User-supplied path: no sanitizing, only the index when there are several queries
+                    output_path = output_file.with_name(prefix + output_file.name) if prefix else output_file
+                else:
+                    output_path = get_output_path(query, output_dir, prefix)
+                progress = f"{i}{total_suffix}"
                 
-                # Save to individual JSON file
-                output_data = {
-                    "query": query,
-                    "count": len(results),
-                    "results": results,
-                }
+                print(f"[{progress}] Searching: \"{query}\"")
                 
-                output_path.write_text(
-                    json.dumps(output_data, ensure_ascii=False, indent=2),
-                    encoding="utf-8"
-                )
-                
-                print(f"    ✓ Found {len(results)} results → {output_path}")
+                try:
+                    results = await scrape_query(
+                        playwright=playwright,
+                        query=query,
+                        proxy_pool=proxy_pool,
+                        timeout_s=timeout,
+                        headless=headless,
+                        scroll_limit=scroll_limit,
+                        scroll_pause=scroll_pause,
+                    )
+                    
+                    output_data = {
+                        "query": query,
+                        "count": len(results),
+                        "results": results,
+                    }
+                    
+                    if ndjson:
+                        # Append one compact line to the shared, buffered stream
+                        ndjson.write(dump_json(output_data) + b"\n")
+                    else:
+                        # Save to individual JSON file, off the event loop so other queries keep running
+                        await asyncio.to_thread(output_path.write_bytes, dump_json(output_data, pretty))
+                    
+                    print(f"    [{progress}] ✓ Found {len(results)} results → {output_path}")
+                    
+                except Exception as e:
+                    print(f"    [{progress}] ✗ Error: {e}")
+            finally:
+                sem.release()
+        
+        try:
+            # Opened inside the try so the finally below always closes it
+            if output_ndjson:
+                ndjson = open(output_ndjson, 'wb', buffering=1 << 20)
+            
+            # One browser for the whole batch; queries only lease contexts from the pool
+            await browser_manager.start(playwright, headless)
+            
+            tasks: set[asyncio.Task] = set()
+            try:
+                # Without a known total, peek two queries to decide on numbered filenames
+                query_iter = iter(queries)
+                head = list(itertools.islice(query_iter, 2))
+                multi = total > 1 if total is not None else len(head) > 1
                 
-            except Exception as e:
-                print(f"    ✗ Error: {e}")
+                # Take a slot before starting each query, so the input stays lazy
+                for i, query in enumerate(itertools.chain(head, query_iter), 1):
+                    await sem.acquire()
+                    task = asyncio.create_task(_one(i, query, f"{i:03d}_" if multi else None))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+            except Exception:
+                # Input failed mid-stream (e.g. a bad CSV row): finish and save the
+                # queries already running before the shared browser is closed
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
+            
+            await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            await context_pool.aclose()
+            await browser_manager.aclose()
+            if ndjson:
+                ndjson.close()
+    
+    print()
+    print(f"✓ Done! Results saved to: {prefixed_out if output_file and multi else abs_out}")
+
+
+async def run_proxy_tests(playwright, proxies: list) -> None:
+    """Probe every proxy and print the results in file order."""
+    print("Testing proxies...")
+    print("-" * 50)
+    
+    sem = asyncio.Semaphore(PROXY_TEST_CONCURRENCY)
+    
+    async def _probe(proxy) -> tuple[bool, str]:
+        async with sem:
+            return await test_proxy(playwright, proxy.url)
+    
+    try:
+        # Probes are pure network waits, so run them together
+        results = await asyncio.gather(*[_probe(p) for p in proxies])
+    finally:
+        await browser_manager.aclose()
     
+    for i, (proxy, (success, message)) in enumerate(zip(proxies, results), 1):
+        print(f"\n[{i}/{len(proxies)}] Testing: {proxy.host}:{proxy.port}")
+        status = "✓" if success else "✗"
+        print(f"    {status} {message}")
+    
+    print("\n" + "-" * 50)
+    print("Proxy testing complete.")
     print()
-    print(f"✓ Done! Results saved to: {output_dir.absolute()}")
 
 
 def main() -> int:
@@ -198,6 +434,7 @@ Examples:
   Config file:            python3 scraper.py --config config.yaml
   With proxies:           python3 scraper.py --csv queries.csv --proxies proxies.txt
   Test proxies:           python3 scraper.py --proxies proxies.txt --test-proxies
+  Test, then scrape:      python3 scraper.py --csv queries.csv --proxies proxies.txt --test-proxies
         """
     )
     
@@ -216,7 +453,7 @@ Examples:
         "--config",
         type=Path,
         metavar="FILE",
-        help="Config file (JSON or YAML)"
+        help="Config file (JSON, YAML or TOML)"
     )
     parser.add_argument(
         "--proxies",
@@ -224,17 +461,42 @@ Examples:
         metavar="FILE",
         help="Proxy file (SOAX format supported)"
     )
-    parser.add_argument(
+    output_group = parser.add_mutually_exclusive_group()
+    output_group.add_argument(
         "--output-dir",
         type=Path,
         default=Path("output"),
         metavar="DIR",
         help="Output directory (default: ./output)"
     )
+    output_group.add_argument(
+        "--output-file",
+        type=Path,
+        metavar="FILE",
+        help="Exact output file for a single query (several queries get a 001_ style prefix)"
+    )
+    output_group.add_argument(
+        "--output-ndjson",
+        type=Path,
+        metavar="FILE",
+        help="Write all results to one NDJSON file (one line per query) instead of per-query files"
+    )
+    parser.add_argument(
+        "--pretty",
+        action="store_true",
+        help="Indent output JSON for reading (default: compact)"
+    )
     parser.add_argument(
         "--concurrency",
         default="5",
-        help="Concurrency: 1..N (default: 5, browser-based)"
+        help="Max browser contexts open at once: 1..N or inf (default: 5); also caps --query-concurrency"
+    )
+    parser.add_argument(
+        "--query-concurrency",
+        type=int,
+        default=3,
+        metavar="N",
+        help="Number of queries scraped at the same time (default: 3)"
     )
     parser.add_argument(
         "--timeout",
@@ -259,93 +521,119 @@ Examples:
         type=float,
         default=2.0,
         metavar="SECONDS",
-        help="Seconds to wait between scrolls (default: 2.0)"
+        help="Max seconds to wait for new results after each scroll (default: 2.0)"
     )
     parser.add_argument(
         "--test-proxies",
         action="store_true",
-        help="Test proxy connections without scraping"
+        help="Test proxy connections (then scrape, if queries are given)"
     )
     
     args = parser.parse_args()
     
-    # Test proxies if requested (do this first before interactive mode)
+    # Options given explicitly on the command line: argparse only fills in
+    # defaults for attributes missing from the namespace, so a sentinel
+    # namespace shows which ones the user actually passed
+    unset = object()
+    given = parser.parse_args(namespace=argparse.Namespace(**dict.fromkeys(vars(args), unset)))
+    explicit = {key for key, value in vars(given).items() if value is not unset}
+    
+    # Config settings replace defaults (explicit CLI options win); applied before
+    # anything else so e.g. --test-proxies can use the config's proxy file
+    config: dict[str, Any] = {}
+    if args.config:
+        config = load_config(args.config)
+        overrides = {k for k in _CONFIG_KEYS.keys() & config.keys() if config[k] not in (None, "")}
+        if explicit & set(_OUTPUT_KEYS):
+            # An output destination on the CLI replaces the config's one
+            overrides -= set(_OUTPUT_KEYS)
+        else:
+            outputs = [k for k in _OUTPUT_KEYS if k in overrides]
+            if len(outputs) > 1:
+                parser.error(f"config sets more than one output destination: {', '.join(outputs)}")
+        for key in overrides - explicit:
+            try:
+                setattr(args, key, _CONFIG_KEYS[key](config[key]))
+            except ValueError as e:
+                parser.error(f"invalid config value for {key}: {e}")
+        if "headless" in config and "visible" not in explicit:
+            try:
+                args.visible = not parse_bool(config["headless"])
+            except ValueError as e:
+                parser.error(f"invalid config value for headless: {e}")
+    
+    # Test proxies if requested (validated before any interactive prompt)
+    proxies: list = []
     if args.test_proxies:
         if not args.proxies:
-            print("Error: --test-proxies requires --proxies FILE", file=sys.stderr)
+            print("Error: --test-proxies requires --proxies FILE (or proxies in the config)", file=sys.stderr)
             return 1
         
-        print("Testing proxies...")
-        print("-" * 50)
-        
         proxies = load_proxies(args.proxies)
         if not proxies:
             print("No proxies found in file.", file=sys.stderr)
             return 1
-        
-        async def run_tests():
-            async with async_playwright() as playwright:
-                for i, proxy in enumerate(proxies, 1):
-                    proxy_url = proxy.build_url()
-                    print(f"\n[{i}/{len(proxies)}] Testing: {proxy.host}:{proxy.port}")
-                    success, message = await test_proxy(playwright, proxy_url)
-                    status = "✓" if success else "✗"
-                    print(f"    {status} {message}")
-        
-        asyncio.run(run_tests())
-        print("\n" + "-" * 50)
-        print("Proxy testing complete.")
-        return 0
     
-    # Determine input source
-    queries: list[str] = []
-    proxies_file = args.proxies
-    output_dir = args.output_dir
+    # With --test-proxies, only scrape when queries were given explicitly
+    scrape = not args.test_proxies or bool(args.config or args.csv or args.query)
     
-    # Scroll settings (can be overridden by config)
-    scroll_limit = args.scroll_limit
-    scroll_pause = args.scroll_pause
+    # Determine input source
+    queries: Iterable[str] = []
     
     if args.config:
         # Config file mode
-        config = load_config(args.config)
         queries = config.get("queries", [])
         if not queries and config.get("query"):
             queries = [config["query"]]
-        proxies_file = Path(config["proxies"]) if config.get("proxies") else proxies_file
-        output_dir = Path(config.get("output_dir", output_dir))
-        scroll_limit = config.get("scroll_limit", scroll_limit)
-        scroll_pause = config.get("scroll_pause", scroll_pause)
         
     elif args.csv:
-        # CSV mode
-        rows = load_queries_from_csv(args.csv)
-        queries = [r["query"] for r in rows]
+        # CSV mode (streamed, so scraping starts before the whole file is read)
+        queries = iter_queries_from_csv(args.csv)
         
     elif args.query:
         # Single query mode
         queries = [args.query]
         
-    else:
+    elif scrape:
         # Interactive mode
         queries = interactive_mode()
     
-    if not queries:
+    total = len(queries) if isinstance(queries, list) else None
+    query_iter = iter(queries)
+    first = next(query_iter, None) if scrape else None
+    if scrape and first is None:
         print("No queries to process.", file=sys.stderr)
         return 1
     
-    # Run scraper
+    async def _main() -> None:
+        # One event loop and one Playwright driver for every phase of the run
+        async with async_playwright() as playwright:
+            if args.test_proxies:
+                await run_proxy_tests(playwright, proxies)
+            if scrape:
+                await run_simple(
+                    queries=itertools.chain([first], query_iter),
+                    proxies_file=args.proxies,
+                    output_dir=args.output_dir,
+                    concurrency=args.concurrency,
+                    timeout=args.timeout,
+                    headless=not args.visible,
+                    scroll_limit=args.scroll_limit,
+                    scroll_pause=args.scroll_pause,
+                    total=total,
+                    query_concurrency=max(args.query_concurrency, 1),
+                    pretty=args.pretty,
+                    output_ndjson=args.output_ndjson,
+                    playwright=playwright,
+                    output_file=args.output_file,
+                )
+    
+    # Run proxy tests and/or scraper
     try:
-        asyncio.run(run_simple(
-            queries=queries,
-            proxies_file=proxies_file,
-            output_dir=output_dir,
-            concurrency=args.concurrency,
-            timeout=args.timeout,
-            headless=not args.visible,
-            scroll_limit=scroll_limit,
-            scroll_pause=scroll_pause,
-        ))
+        if uvloop is not None:
+            uvloop.run(_main())
+        else:
+            asyncio.run(_main())
         return 0
     except KeyboardInterrupt:
         print("\nCancelled.", file=sys.stderr)
@@ -0,0 +1,120 @@
+"""Regression tests for ContextPool eviction with many proxy identities."""
+
+import asyncio
+
+from maps_scraper import ContextPool
+
+
+class _StubBrowser:
+    def is_connected(self) -> bool:
+        return True
+
+
+class _StubContext:
+    def __init__(self, proxy_url: str | None) -> None:
+        self.proxy_url = proxy_url
+        self.browser = _StubBrowser()
+        self.pages: list = []
+        self.closed = False
+
+    async def add_cookies(self, cookies) -> None:
+        pass
+
+    async def close(self) -> None:
+        self.closed = True
+
+
+class _StubManager:
+    def __init__(self) -> None:
+        self.created: list[_StubContext] = []
+
+    async def new_context(self, playwright, proxy_url=None, headless=True) -> _StubContext:
+        await asyncio.sleep(0)  # yield like a real launch, so acquires interleave
+        context = _StubContext(proxy_url)
+        self.created.append(context)
+        return context
+
+
+def _proxy(i: int) -> str:
+    return f"http://user{i}:pw@proxy{i}.example:8000"
+
+
+def test_eviction_with_more_proxies_than_slots():
+    manager = _StubManager()
+    pool = ContextPool(manager, max_contexts=5)
+
+    async def run() -> list:
+        sem = asyncio.Semaphore(3)
+
+        async def one(i: int) -> int:
+            async with sem:
+                async with pool.lease(None, _proxy(i % 8)):
+                    await asyncio.sleep(0.001 * (i % 3))
+            return i
+
+        return await asyncio.gather(*[one(i) for i in range(60)], return_exceptions=True)
+
+    results = asyncio.run(run())
+
+    assert results == list(range(60))
+    assert pool.idle <= 5
+    # Every context is either pooled or closed, none leaked
+    assert sum(not c.closed for c in manager.created) == pool.idle
+
+
+def test_eviction_drops_least_recently_released_identity():
+    manager = _StubManager()
+    pool = ContextPool(manager, max_contexts=2)
+
+    async def run() -> None:
+        for i in (0, 1, 0, 2):
+            async with pool.lease(None, _proxy(i)):
+                pass
+
+    asyncio.run(run())
+
+    by_proxy = {c.proxy_url: c for c in manager.created}
+    assert by_proxy[_proxy(1)].closed
+    assert not by_proxy[_proxy(0)].closed
+    assert not by_proxy[_proxy(2)].closed
+
+
+def test_release_after_taking_an_identitys_last_idle_context():
+    manager = _StubManager()
+    pool = ContextPool(manager, max_contexts=2)
+
+    async def run() -> None:
+        for i in (0, 1):
+            async with pool.lease(None, _proxy(i)):
+                pass
+        # Take proxy 0's only idle context, then fill the pool up behind it
+        async with pool.lease(None, _proxy(0)):
+            async with pool.lease(None, _proxy(2)):
+                pass
+
+    asyncio.run(run())
+
+    assert pool.idle == 2
+    assert sum(not c.closed for c in manager.created) == 2
+
+
+def test_open_contexts_never_exceed_max_contexts():
+    manager = _StubManager()
+    pool = ContextPool(manager, max_contexts=2)
+    peak = 0
+
+    async def run() -> None:
+        nonlocal peak
+
+        async def one(i: int) -> None:
+            nonlocal peak
+            async with pool.lease(None, _proxy(i % 5)):
+                peak = max(peak, sum(not c.closed for c in manager.created))
+                await asyncio.sleep(0.001 * (i % 3))
+
+        await asyncio.gather(*[one(i) for i in range(40)])
+
+    asyncio.run(run())
+
+    assert peak <= 2
+    assert sum(not c.closed for c in manager.created) <= 2